@@ -1,10 +1,14 @@
+import os
+
 from django.contrib.auth.models import AbstractUser
-from django.db import models
+from django.db import models, transaction
+from django.db.models.functions import Lower
+from django.dispatch import receiver
 from django.utils.html import escape, mark_safe
 from django.core.validators import MinValueValidator, MaxValueValidator
+from django.utils.functional import cached_property
 from embed_video.fields import EmbedVideoField
 from django.utils import timezone
-from django.core.exceptions import ValidationError
 
 
 
@@ -26,18 +30,18 @@ class User(AbstractUser):
 class Profile(models.Model):
     """User profile model with additional personal information."""
     user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='profile')
-    avatar = models.ImageField(upload_to='profiles/avatars/', default='no-img.jpg', blank=True)
+    avatar = models.ImageField(upload_to='profiles/avatars/', null=True, blank=True)
     first_name = models.CharField(max_length=255, default='', blank=True)
     last_name = models.CharField(max_length=255, default='', blank=True)
-    email = models.EmailField(unique=True)
+    email = models.EmailField()
     phonenumber = models.CharField(max_length=20, blank=True, null=True)
     birth_date = models.DateField(default='2000-01-01')
     bio = models.TextField(default='', blank=True)
-    city = models.CharField(max_length=255, default='', blank=True)
-    state = models.CharField(max_length=255, default='', blank=True)
-    country = models.CharField(max_length=255, default='', blank=True)
-    favorite_animal = models.CharField(max_length=255, default='', blank=True)
-    hobby = models.CharField(max_length=255, default='', blank=True)
+    city = models.CharField(max_length=80, default='', blank=True)
+    state = models.CharField(max_length=80, default='', blank=True)
+    country = models.CharField(max_length=80, default='', blank=True)
+    favorite_animal = models.CharField(max_length=60, default='', blank=True)
+    hobby = models.CharField(max_length=60, default='', blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
@@ -45,13 +49,27 @@ class Profile(models.Model):
         verbose_name = "Profile"
         verbose_name_plural = "Profiles"
         ordering = ['user__username']
+        constraints = [
+            models.UniqueConstraint(Lower('email'), name='uniq_profile_email_ci'),
+        ]
+        indexes = [
+            models.Index(fields=['user'], name='profile_has_avatar',
+                         condition=models.Q(avatar__isnull=False)),
+        ]
 
     def __str__(self):
         return f"{self.user.username}'s Profile"
 
-    def clean(self):
-        if self.email and Profile.objects.filter(email=self.email).exclude(pk=self.pk).exists():
-            raise ValidationError("Email already exists")
+    def save(self, *args, **kwargs):
+        if self.email:
+            self.email = self.email.lower()
+        super().save(*args, **kwargs)
+
+
+class AnnouncementListManager(models.Manager):
+    """Manager for list views that skips the announcement body."""
+    def get_queryset(self):
+        return super().get_queryset().defer('content')
 
 
 class Announcement(models.Model):
@@ -62,13 +80,16 @@ class Announcement(models.Model):
     posted_at = models.DateTimeField(auto_now_add=True)
     is_active = models.BooleanField(default=True)
 
+    objects = models.Manager()
+    list_objects = AnnouncementListManager()
+
     class Meta:
         verbose_name = "Announcement"
         verbose_name_plural = "Announcements"
         ordering = ['-posted_at']
         indexes = [
-            models.Index(fields=['-posted_at']),
-            models.Index(fields=['is_active']),
+            models.Index(fields=['-posted_at'], name='ann_active_posted_idx',
+                         condition=models.Q(is_active=True)),
         ]
 
     def __str__(self):
@@ -98,19 +119,28 @@ class Course(models.Model):
         verbose_name = "Course"
         verbose_name_plural = "Courses"
         ordering = ['name']
-        indexes = [
-            models.Index(fields=['name']),
-            models.Index(fields=['category']),
-        ]
 
     def __str__(self):
         return self.name
 
+    @cached_property
+    def html_badge(self):
+        return mark_safe(f'<span class="badge badge-primary" style="background-color: {escape(self.color)}">{escape(self.name)}</span>')
+
     def get_html_badge(self):
-        name = escape(self.name)
-        color = escape(self.color)
-        html = '<span class="badge badge-primary" style="background-color: %s">%s</span>' % (color, name)
-        return mark_safe(html)
+        return self.html_badge
+
+
+class TutorialManager(models.Manager):
+    """Default manager that joins the FKs dereferenced by __str__ and list rows."""
+    def get_queryset(self):
+        return super().get_queryset().select_related('course', 'user')
+
+
+class TutorialListManager(TutorialManager):
+    """Manager for list views that skips the tutorial body."""
+    def get_queryset(self):
+        return super().get_queryset().defer('content')
 
 
 class Tutorial(models.Model):
@@ -134,23 +164,38 @@ class Tutorial(models.Model):
     is_published = models.BooleanField(default=True)
     views_count = models.PositiveIntegerField(default=0)
 
+    objects = TutorialManager()
+    list_objects = TutorialListManager()
+    raw_objects = models.Manager()
+
     class Meta:
         verbose_name = "Tutorial"
         verbose_name_plural = "Tutorials"
         ordering = ['-created_at']
         indexes = [
-            models.Index(fields=['course', '-created_at']),
             models.Index(fields=['user', '-created_at']),
-            models.Index(fields=['is_published']),
+            models.Index(fields=['course', '-created_at'], name='tut_pub_idx',
+                         condition=models.Q(is_published=True)),
         ]
 
     def __str__(self):
         return f"{self.title} ({self.course.name})"
 
+    @classmethod
+    def increment_views(cls, pk):
+        """Bump views_count with a single UPDATE; no row fetch, no lost updates."""
+        cls.objects.filter(pk=pk).update(views_count=models.F('views_count') + 1)
+
+
+class NotesManager(models.Manager):
+    """Default manager that joins the FKs dereferenced by __str__ and list rows."""
+    def get_queryset(self):
+        return super().get_queryset().select_related('course', 'user')
+
 
 class Notes(models.Model):
     """Notes model for additional course materials."""
-    title = models.CharField(max_length=500)
+    title = models.CharField(max_length=200)
     file = models.FileField(upload_to='notes/files/', null=True, blank=True)
     cover = models.ImageField(upload_to='notes/covers/', null=True, blank=True)
     course = models.ForeignKey(Course, on_delete=models.CASCADE, related_name='notes')
@@ -160,6 +205,9 @@ class Notes(models.Model):
     is_public = models.BooleanField(default=True)
     download_count = models.PositiveIntegerField(default=0)
 
+    objects = NotesManager()
+    raw_objects = models.Manager()
+
     class Meta:
         verbose_name = "Note"
         verbose_name_plural = "Notes"
@@ -172,12 +220,44 @@ class Notes(models.Model):
     def __str__(self):
         return f"{self.title} - {self.course.name}"
 
-    def delete(self, *args, **kwargs):
-        if self.file:
-            self.file.delete(save=False)
-        if self.cover:
-            self.cover.delete(save=False)
-        super().delete(*args, **kwargs)
+    @classmethod
+    def increment_downloads(cls, pk):
+        """Bump download_count with a single UPDATE; no row fetch, no lost updates."""
+        cls.objects.filter(pk=pk).update(download_count=models.F('download_count') + 1)
+
+    @classmethod
+    def bulk_delete(cls, queryset):
+        """Delete a queryset of notes with a single batched file cleanup.
+
+        File and cover paths are collected in one query before the rows go,
+        then removed from storage in one pass after the transaction commits.
+        """
+        names = [name for pair in queryset.values_list('file', 'cover') for name in pair if name]
+        storage = cls._meta.get_field('file').storage
+        deleted = queryset.delete()
+        transaction.on_commit(lambda: _cleanup_note_files(storage, names))
+        return deleted
+
+
+class QuizListManager(models.Manager):
+    """Manager for list views that skips the quiz description."""
+    def get_queryset(self):
+        return super().get_queryset().defer('description')
+
+
+def _cleanup_note_files(storage, names):
+    """Remove stored files for deleted notes; already-missing files are ignored."""
+    for name in names:
+        storage.delete(name)
+
+
+@receiver(models.signals.post_delete, sender=Notes)
+def _notes_post_delete(sender, instance, **kwargs):
+    """Queue storage cleanup after commit instead of blocking the delete."""
+    names = [name for name in (instance.file.name, instance.cover.name) if name]
+    if names:
+        storage = instance.file.storage
+        transaction.on_commit(lambda: _cleanup_note_files(storage, names))
 
 
 class Quiz(models.Model):
@@ -198,21 +278,40 @@ class Quiz(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     max_attempts = models.PositiveIntegerField(default=3, validators=[MinValueValidator(1)])
+    questions_count = models.PositiveIntegerField(default=0)
+
+    objects = models.Manager()
+    list_objects = QuizListManager()
 
     class Meta:
         verbose_name = "Quiz"
         verbose_name_plural = "Quizzes"
         ordering = ['-created_at']
+        constraints = [
+            models.CheckConstraint(condition=models.Q(time_limit_minutes__gte=1) & models.Q(time_limit_minutes__lte=180),
+                                   name='quiz_time_range'),
+            models.CheckConstraint(condition=models.Q(passing_score__gte=0.0) & models.Q(passing_score__lte=100.0),
+                                   name='quiz_pass_range'),
+            models.CheckConstraint(condition=models.Q(max_attempts__gte=1),
+                                   name='quiz_max_attempts_min'),
+        ]
         indexes = [
             models.Index(fields=['course', '-created_at']),
             models.Index(fields=['owner', '-created_at']),
-            models.Index(fields=['status']),
+            models.Index(fields=['course', '-created_at'], name='quiz_pub_idx',
+                         condition=models.Q(status='published')),
         ]
 
     def __str__(self):
         return f"{self.name} ({self.course.name})"
 
 
+class QuestionManager(models.Manager):
+    """Default manager that joins the quiz (and its course) dereferenced by __str__."""
+    def get_queryset(self):
+        return super().get_queryset().select_related('quiz', 'quiz__course')
+
+
 class Question(models.Model):
     """Question model for quizzes."""
     QUESTION_TYPES = [
@@ -222,23 +321,59 @@ class Question(models.Model):
     ]
     
     quiz = models.ForeignKey(Quiz, on_delete=models.CASCADE, related_name='questions')
-    text = models.CharField('Question', max_length=500)
+    text = models.CharField('Question', max_length=300)
     question_type = models.CharField(max_length=20, choices=QUESTION_TYPES, default='multiple_choice')
     points = models.PositiveIntegerField(default=1, validators=[MinValueValidator(1)])
     order = models.PositiveIntegerField(default=1)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    objects = QuestionManager()
+    raw_objects = models.Manager()
+
     class Meta:
         verbose_name = "Question"
         verbose_name_plural = "Questions"
         ordering = ['order', 'id']
         indexes = [
-            models.Index(fields=['quiz', 'order']),
+            models.Index(fields=['quiz', 'order', 'id'], name='q_quiz_order_id_idx',
+                         include=['text', 'question_type', 'points']),
         ]
 
     def __str__(self):
         return f"{self.text[:50]}... ({self.quiz.name})"
 
+    def save(self, *args, **kwargs):
+        adding = self._state.adding
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            if adding:
+                Quiz.objects.filter(pk=self.quiz_id).update(
+                    questions_count=models.F('questions_count') + 1)
+
+    def delete(self, *args, **kwargs):
+        with transaction.atomic():
+            Quiz.objects.filter(pk=self.quiz_id).update(
+                questions_count=models.F('questions_count') - 1)
+            return super().delete(*args, **kwargs)
+
+    @classmethod
+    def bulk_add(cls, quiz, rows):
+        """Insert many questions for a quiz in batches instead of per-row saves.
+
+        ``rows`` is an iterable of field dicts (without ``quiz``); the batch
+        size is tunable via the QUIZ_BULK_BATCH_SIZE environment variable.
+        """
+        batch_size = int(os.environ.get('QUIZ_BULK_BATCH_SIZE', '500'))
+        with transaction.atomic():
+            created = cls.objects.bulk_create(
+                [cls(quiz=quiz, **row) for row in rows],
+                batch_size=batch_size,
+            )
+            if created:
+                Quiz.objects.filter(pk=quiz.pk).update(
+                    questions_count=models.F('questions_count') + len(created))
+            return created
+
 
 class Answer(models.Model):
     """Answer model for questions."""
@@ -253,22 +388,47 @@ class Answer(models.Model):
         verbose_name_plural = "Answers"
         ordering = ['order', 'id']
         indexes = [
-            models.Index(fields=['question', 'order']),
+            models.Index(fields=['question', 'order', 'id'], name='a_q_order_id_idx',
+                         include=['text', 'is_correct']),
         ]
 
     def __str__(self):
         return f"{self.text[:50]}... ({'Correct' if self.is_correct else 'Incorrect'})"
 
+    @classmethod
+    def bulk_add(cls, question, rows):
+        """Insert many answers for a question in batches instead of per-row saves.
+
+        ``rows`` is an iterable of field dicts (without ``question``); the
+        batch size is tunable via the QUIZ_BULK_BATCH_SIZE environment
+        variable.
+        """
+        batch_size = int(os.environ.get('QUIZ_BULK_BATCH_SIZE', '500'))
+        with transaction.atomic():
+            return cls.objects.bulk_create(
+                [cls(question=question, **row) for row in rows],
+                batch_size=batch_size,
+            )
+
+
+class SelectRelatedUserManager(models.Manager):
+    """Default manager that joins the user row dereferenced by __str__."""
+    def get_queryset(self):
+        return super().get_queryset().select_related('user')
+
 
 class Learner(models.Model):
     """Learner profile model."""
     user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True)
     quizzes = models.ManyToManyField(Quiz, through='TakenQuiz', related_name='learners')
-    interests = models.ManyToManyField(Course, related_name='interested_learners')
+    interests = models.ManyToManyField(Course, through='LearnerInterest', related_name='interested_learners')
     total_score = models.FloatField(default=0.0)
     quizzes_completed = models.PositiveIntegerField(default=0)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    objects = SelectRelatedUserManager()
+    raw_objects = models.Manager()
+
     class Meta:
         verbose_name = "Learner"
         verbose_name_plural = "Learners"
@@ -279,22 +439,26 @@ class Learner(models.Model):
 
     def get_unanswered_questions(self, quiz):
         """Get questions that the learner hasn't answered for a specific quiz."""
-        answered_questions = self.quiz_answers \
-            .filter(answer__question__quiz=quiz) \
-            .values_list('answer__question__pk', flat=True)
-        questions = quiz.questions.exclude(pk__in=answered_questions).order_by('order', 'id')
+        answered = LearnerAnswer.objects.filter(student=self, answer__question=models.OuterRef('pk'))
+        questions = quiz.questions \
+            .annotate(_answered=models.Exists(answered)) \
+            .filter(_answered=False) \
+            .order_by('order', 'id')
         return questions
 
 
 class Instructor(models.Model):
     """Instructor profile model."""
-    user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='instructor_profile')
-    expertise = models.ManyToManyField(Course, related_name='instructors')
+    user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, related_name='instructor_profile')
+    expertise = models.ManyToManyField(Course, through='InstructorExpertise', related_name='instructors')
     bio = models.TextField(default='', blank=True)
     years_experience = models.PositiveIntegerField(default=0, validators=[MinValueValidator(0)])
     is_verified = models.BooleanField(default=False)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    objects = SelectRelatedUserManager()
+    raw_objects = models.Manager()
+
     class Meta:
         verbose_name = "Instructor"
         verbose_name_plural = "Instructors"
@@ -304,6 +468,42 @@ class Instructor(models.Model):
         return f"Instructor: {self.user.username}"
 
 
+class LearnerInterest(models.Model):
+    """Through table for Learner.interests with a reverse (course, learner) index."""
+    learner = models.ForeignKey(Learner, on_delete=models.CASCADE)
+    course = models.ForeignKey(Course, on_delete=models.CASCADE)
+
+    class Meta:
+        unique_together = [('learner', 'course')]
+        indexes = [
+            models.Index(fields=['course', 'learner']),
+        ]
+
+    def __str__(self):
+        return f"{self.learner.user.username} -> {self.course.name}"
+
+
+class InstructorExpertise(models.Model):
+    """Through table for Instructor.expertise with a reverse (course, instructor) index."""
+    instructor = models.ForeignKey(Instructor, on_delete=models.CASCADE)
+    course = models.ForeignKey(Course, on_delete=models.CASCADE)
+
+    class Meta:
+        unique_together = [('instructor', 'course')]
+        indexes = [
+            models.Index(fields=['course', 'instructor']),
+        ]
+
+    def __str__(self):
+        return f"{self.instructor.user.username} -> {self.course.name}"
+
+
+class TakenQuizManager(models.Manager):
+    """Default manager that joins the learner's user and the quiz dereferenced by __str__."""
+    def get_queryset(self):
+        return super().get_queryset().select_related('learner__user', 'quiz')
+
+
 class TakenQuiz(models.Model):
     """Model to track quiz attempts by learners."""
     learner = models.ForeignKey(Learner, on_delete=models.CASCADE, related_name='taken_quizzes')
@@ -314,11 +514,20 @@ class TakenQuiz(models.Model):
     is_completed = models.BooleanField(default=True)
     attempt_number = models.PositiveIntegerField(default=1)
 
+    objects = TakenQuizManager()
+    raw_objects = models.Manager()
+
     class Meta:
         verbose_name = "Taken Quiz"
         verbose_name_plural = "Taken Quizzes"
         ordering = ['-date']
-        unique_together = ['learner', 'quiz', 'attempt_number']
+        constraints = [
+            models.UniqueConstraint(fields=['learner', 'quiz', 'attempt_number'],
+                                    name='uniq_taken_attempt',
+                                    deferrable=models.Deferrable.DEFERRED),
+            models.CheckConstraint(condition=models.Q(score__gte=0.0) & models.Q(score__lte=100.0),
+                                   name='taken_quiz_score_range'),
+        ]
         indexes = [
             models.Index(fields=['learner', '-date']),
             models.Index(fields=['quiz', '-date']),
@@ -328,6 +537,31 @@ class TakenQuiz(models.Model):
     def __str__(self):
         return f"{self.learner.user.username} - {self.quiz.name} ({self.score}%)"
 
+    def save(self, *args, **kwargs):
+        adding = self._state.adding
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            if adding and self.is_completed:
+                Learner.objects.filter(pk=self.learner_id).update(
+                    total_score=models.F('total_score') + self.score,
+                    quizzes_completed=models.F('quizzes_completed') + 1,
+                )
+
+    def delete(self, *args, **kwargs):
+        with transaction.atomic():
+            if self.is_completed:
+                Learner.objects.filter(pk=self.learner_id).update(
+                    total_score=models.F('total_score') - self.score,
+                    quizzes_completed=models.F('quizzes_completed') - 1,
+                )
+            return super().delete(*args, **kwargs)
+
+
+class LearnerAnswerManager(models.Manager):
+    """Default manager that joins the student's user, question and answer dereferenced by __str__."""
+    def get_queryset(self):
+        return super().get_queryset().select_related('student__user', 'question', 'answer')
+
 
 class LearnerAnswer(models.Model):
     """Model to track learner answers."""
@@ -336,12 +570,16 @@ class LearnerAnswer(models.Model):
     question = models.ForeignKey(Question, on_delete=models.CASCADE, related_name='learner_answers')
     created_at = models.DateTimeField(auto_now_add=True)
 
+    objects = LearnerAnswerManager()
+    raw_objects = models.Manager()
+
     class Meta:
         verbose_name = "Learner Answer"
         verbose_name_plural = "Learner Answers"
         unique_together = ['student', 'question']
         indexes = [
             models.Index(fields=['student', 'question']),
+            models.Index(fields=['student', 'answer']),
             models.Index(fields=['answer']),
         ]
 